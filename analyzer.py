@@ -29,6 +29,9 @@ generation_config = {
 
 model = genai.GenerativeModel("gemini-2.0-flash", generation_config=generation_config)
 
+# Respect rate limits (Gemini Free Tier is ~15 RPM)
+RATE_LIMIT_SECONDS = 20
+
 
 def analyze_post(post_data, use_vision=True):
     """
@@ -115,6 +118,11 @@ Include only relevant fields for the category."""
         response = model.generate_content(content_parts)
         result_text = response.text.replace("```json", "").replace("```", "").strip()
         result = json.loads(result_text)
+
+        # Actual tokens billed for this call (used by main.py's per-run budget)
+        usage = getattr(response, "usage_metadata", None)
+        if usage is not None:
+            result["token_count"] = usage.total_token_count
         
         # Log if Job was detected
         if result.get("category") == "Job":
@@ -125,6 +133,17 @@ Include only relevant fields for the category."""
         print(f"Error analyzing post: {e}")
         return {"category": "Error", "error": str(e)}
 
+def attach_source_metadata(analysis_result, post):
+    """Preserve metadata from the source post in the analysis result."""
+    if "data" not in analysis_result:
+        analysis_result["data"] = {}
+
+    analysis_result["data"]["instagram_shortcode"] = post.get("shortcode")
+    analysis_result["data"]["original_url"] = post.get("postUrl")
+    analysis_result["data"]["posted_at"] = post.get("timestamp")
+    analysis_result["data"]["author"] = post.get("username")
+    return analysis_result
+
 if __name__ == "__main__":
     # Test data
     sample_post = {
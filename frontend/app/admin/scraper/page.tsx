@@ -1,6 +1,6 @@
 "use client";
 
-import { useState, useEffect } from 'react';
+import { useState, useEffect, useRef } from 'react';
 import { createClient } from '@supabase/supabase-js';
 
 const supabaseUrl = process.env.NEXT_PUBLIC_SUPABASE_URL || '';
@@ -25,10 +25,42 @@ interface LogSummary {
     oldSkipped: number;
     newPosts: number;
     categories: { [key: string]: number };
-    status: 'idle' | 'running' | 'success' | 'error' | 'no_data';
+    status: 'idle' | 'running' | 'success' | 'error' | 'no_data' | 'cancelled';
     message: string;
 }
 
+// One JSON-lines progress event emitted by main.py --progress-json
+interface PipelineEvent {
+    type: 'progress';
+    event: string;
+    ts: number;
+    [key: string]: any;
+}
+
+interface PostOutcome {
+    index: number;
+    total: number;
+    shortcode: string;
+    category: string;
+    error?: string | null;
+    tokens?: number;
+    elapsed: number;
+}
+
+const STAGE_LABELS: { [key: string]: string } = {
+    fetch: '取得中',
+    analyze: '解析中',
+    save: '保存中',
+    enqueue: 'キュー投入中'
+};
+
+const DONE_STATUS: { [key: string]: LogSummary['status'] } = {
+    success: 'success',
+    no_data: 'no_data',
+    cancelled: 'cancelled',
+    error: 'error'
+};
+
 export default function ScraperAdmin() {
     const [loading, setLoading] = useState(false);
     const [logs, setLogs] = useState<string>('');
@@ -36,10 +68,16 @@ export default function ScraperAdmin() {
     const [country, setCountry] = useState<string>('Toronto');
     const [posts, setPosts] = useState<Post[]>([]);
     const [logSummary, setLogSummary] = useState<LogSummary | null>(null);
+    const [currentStage, setCurrentStage] = useState<string>('');
+    const [postOutcomes, setPostOutcomes] = useState<PostOutcome[]>([]);
+    // X-Run-Id of the running scrape, used to cancel it via DELETE /api/scrape
+    const runIdRef = useRef<string | null>(null);
+    const [cancelling, setCancelling] = useState(false);
 
     // Filter settings
     const [daysFilter, setDaysFilter] = useState<number>(14);
     const [maxPosts, setMaxPosts] = useState<number>(10);
+    const [tokenBudget, setTokenBudget] = useState<number>(0);
     const [skipDuplicates, setSkipDuplicates] = useState<boolean>(true);
 
     const [selectedPosts, setSelectedPosts] = useState<number[]>([]);
@@ -127,56 +165,111 @@ export default function ScraperAdmin() {
         }
     };
 
-    // Parse log output to extract summary
-    const parseLogOutput = (output: string): LogSummary => {
-        const summary: LogSummary = {
-            totalFetched: 0,
-            duplicateSkipped: 0,
-            oldSkipped: 0,
-            newPosts: 0,
-            categories: {},
-            status: 'success',
-            message: ''
-        };
-
-        // Parse numbers from log
-        const fetchedMatch = output.match(/Filtering (\d+) raw posts/);
-        if (fetchedMatch) summary.totalFetched = parseInt(fetchedMatch[1]);
-
-        const dupMatch = output.match(/Skipped (\d+) duplicate/);
-        if (dupMatch) summary.duplicateSkipped = parseInt(dupMatch[1]);
-
-        const oldMatch = output.match(/Skipped (\d+) old posts/);
-        if (oldMatch) summary.oldSkipped = parseInt(oldMatch[1]);
-
-        const retainedMatch = output.match(/Retained (\d+) new posts/);
-        if (retainedMatch) summary.newPosts = parseInt(retainedMatch[1]);
-
-        // Parse categories
-        const catMatch = output.match(/Category breakdown: ({[^}]+})/);
-        if (catMatch) {
-            try {
-                summary.categories = JSON.parse(catMatch[1].replace(/'/g, '"'));
-            } catch { }
+    const emptySummary = (status: LogSummary['status'], message: string): LogSummary => ({
+        totalFetched: 0, duplicateSkipped: 0, oldSkipped: 0, newPosts: 0,
+        categories: {}, status, message
+    });
+
+    // Apply one structured progress event (main.py --progress-json) to the live view
+    const handleProgress = (event: PipelineEvent) => {
+        switch (event.event) {
+            case 'stage':
+                if (event.status === 'started') {
+                    setCurrentStage(STAGE_LABELS[event.stage] || event.stage);
+                }
+                break;
+            case 'apify_status':
+                setCurrentStage(`${STAGE_LABELS.fetch} (Apify: ${event.status})`);
+                break;
+            case 'filter':
+                setLogSummary(prev => ({
+                    ...(prev || emptySummary('running', '実行中...')),
+                    totalFetched: event.raw,
+                    duplicateSkipped: event.duplicates,
+                    oldSkipped: event.old,
+                    newPosts: event.retained
+                }));
+                break;
+            case 'post':
+                setCurrentStage(`${STAGE_LABELS.analyze} (${event.index}/${event.total})`);
+                setPostOutcomes(prev => [...prev, {
+                    index: event.index,
+                    total: event.total,
+                    shortcode: event.shortcode,
+                    category: event.category,
+                    error: event.error,
+                    tokens: event.tokens,
+                    elapsed: event.elapsed
+                }]);
+                setLogSummary(prev => {
+                    const base = prev || emptySummary('running', '実行中...');
+                    if (event.category === 'Error') return base;
+                    return {
+                        ...base,
+                        categories: { ...base.categories, [event.category]: (base.categories[event.category] || 0) + 1 }
+                    };
+                });
+                break;
+            case 'budget_exhausted':
+                setCurrentStage(`トークン上限に到達（${event.skipped}件スキップ）`);
+                break;
+            case 'done':
+                setLogSummary(prev => ({
+                    ...(prev || emptySummary('running', '')),
+                    categories: event.categories || prev?.categories || {},
+                    status: DONE_STATUS[event.status] || 'success',
+                    message: event.status === 'no_data' ? '処理可能な新しい投稿がありませんでした' :
+                        event.status === 'cancelled' ? `キャンセルしました（${event.saved ?? 0}件保存）` :
+                            event.status === 'error' ? 'エラーが発生しました: ' + (event.message || '') :
+                                `スクレイピング完了（${Math.round(event.elapsed)}秒）`
+                }));
+                break;
         }
+    };
 
-        // Check for no data
-        if (output.includes('No posts found to process')) {
-            summary.status = 'no_data';
-            summary.message = '処理可能な新しい投稿がありませんでした';
-        } else if (output.includes('=== Done ===')) {
-            summary.status = 'success';
-            summary.message = 'スクレイピング完了';
+    // Read the text/event-stream response from /api/scrape frame by frame
+    const readEventStream = async (response: Response) => {
+        const reader = response.body!.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        let exitCode: number | null = null;
+
+        while (true) {
+            const { done, value } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+
+            const frames = buffer.split('\n\n');
+            buffer = frames.pop() || '';
+            for (const frame of frames) {
+                let eventName = 'message';
+                let data = '';
+                for (const line of frame.split('\n')) {
+                    if (line.startsWith('event: ')) eventName = line.slice(7);
+                    else if (line.startsWith('data: ')) data += line.slice(6);
+                }
+                if (!data) continue;
+                const payload = JSON.parse(data);
+
+                if (eventName === 'progress') {
+                    handleProgress(payload);
+                } else if (eventName === 'log') {
+                    setLogs(prev => prev + payload.line + '\n');
+                } else if (eventName === 'end') {
+                    exitCode = payload.code;
+                }
+            }
         }
-
-        return summary;
+        return exitCode;
     };
 
     const startScraping = async () => {
         setLoading(true);
         setStatus('running');
         setLogs('');
-        setLogSummary(null);
+        setPostOutcomes([]);
+        setCurrentStage('開始中...');
+        setLogSummary(emptySummary('running', '実行中...'));
 
         try {
             const response = await fetch('/api/scrape', {
@@ -188,43 +281,62 @@ export default function ScraperAdmin() {
                     country,
                     daysFilter,
                     maxPosts,
-                    skipDuplicates
+                    skipDuplicates,
+                    tokenBudget
                 }),
             });
 
-            const data = await response.json();
-
-            if (data.success) {
-                setStatus('success');
-                setLogs(data.output || '');
+            if (!response.ok || !response.body) {
+                const data = await response.json().catch(() => ({}));
+                throw new Error(data.error || `HTTP ${response.status}`);
+            }
 
-                // Parse and set summary
-                const summary = parseLogOutput(data.output || '');
-                setLogSummary(summary);
+            runIdRef.current = response.headers.get('X-Run-Id');
+            // Read until 'end' even after cancelling: main.py still saves and reports done
+            const exitCode = await readEventStream(response);
 
-                // Refresh posts after scraping
-                fetchPosts();
+            if (exitCode === 0) {
+                setStatus('success');
             } else {
                 setStatus('error');
-                setLogs(data.error || 'Unknown error');
-                setLogSummary({
-                    totalFetched: 0, duplicateSkipped: 0, oldSkipped: 0, newPosts: 0,
-                    categories: {}, status: 'error', message: data.error || 'エラーが発生しました'
-                });
+                setLogSummary(prev => prev && prev.status !== 'running' ? prev :
+                    emptySummary('error', `プロセスが異常終了しました (code: ${exitCode})`));
             }
 
+            // Refresh posts after scraping
+            fetchPosts();
+
         } catch (error: any) {
             setStatus('error');
-            setLogs(error.message);
-            setLogSummary({
-                totalFetched: 0, duplicateSkipped: 0, oldSkipped: 0, newPosts: 0,
-                categories: {}, status: 'error', message: 'ネットワークエラー: ' + error.message
-            });
+            setLogs(prev => prev + error.message);
+            setLogSummary(emptySummary('error', 'ネットワークエラー: ' + error.message));
         } finally {
+            runIdRef.current = null;
+            setCancelling(false);
+            setCurrentStage('');
             setLoading(false);
         }
     };
 
+    // Ask the server to stop main.py; the running stream then delivers the saved/done events
+    const cancelScraping = async () => {
+        if (!runIdRef.current) return;
+        setCancelling(true);
+        setCurrentStage('キャンセル中...（解析済みの投稿を保存しています）');
+        try {
+            const response = await fetch(`/api/scrape?runId=${encodeURIComponent(runIdRef.current)}`, {
+                method: 'DELETE',
+            });
+            if (!response.ok) {
+                const data = await response.json().catch(() => ({}));
+                throw new Error(data.error || `HTTP ${response.status}`);
+            }
+        } catch (error: any) {
+            setCancelling(false);
+            setLogs(prev => prev + 'キャンセルに失敗しました: ' + error.message + '\n');
+        }
+    };
+
     return (
         <div style={{ padding: '2rem', fontFamily: 'sans-serif', maxWidth: '800px', margin: '0 auto' }}>
             <h1>World Info Scraping</h1>
@@ -254,7 +366,7 @@ export default function ScraperAdmin() {
             }}>
                 <h4 style={{ marginTop: 0, marginBottom: '15px', color: '#495057' }}>フィルター設定</h4>
 
-                <div style={{ display: 'grid', gridTemplateColumns: 'repeat(3, 1fr)', gap: '15px' }}>
+                <div style={{ display: 'grid', gridTemplateColumns: 'repeat(4, 1fr)', gap: '15px' }}>
                     <div>
                         <label style={{ display: 'block', marginBottom: '5px', fontSize: '14px', color: '#666' }}>
                             📅 対象期間（日）
@@ -283,6 +395,21 @@ export default function ScraperAdmin() {
                         />
                     </div>
 
+                    <div>
+                        <label style={{ display: 'block', marginBottom: '5px', fontSize: '14px', color: '#666' }}>
+                            🪙 トークン上限（0=無制限）
+                        </label>
+                        <input
+                            type="number"
+                            min="0"
+                            max="1000000"
+                            step="1000"
+                            value={tokenBudget}
+                            onChange={(e) => setTokenBudget(Math.max(parseInt(e.target.value) || 0, 0))}
+                            style={{ width: '100%', padding: '8px', fontSize: '14px', borderRadius: '4px', border: '1px solid #ced4da' }}
+                        />
+                    </div>
+
                     <div style={{ display: 'flex', alignItems: 'center', paddingTop: '20px' }}>
                         <input
                             type="checkbox"
@@ -314,6 +441,31 @@ export default function ScraperAdmin() {
                 {loading ? 'スクレイピング実行中...' : 'スクレイピング開始'}
             </button>
 
+            {status === 'running' && (
+                <button
+                    onClick={cancelScraping}
+                    disabled={cancelling}
+                    style={{
+                        marginLeft: '10px',
+                        padding: '10px 20px',
+                        fontSize: '16px',
+                        backgroundColor: cancelling ? '#ccc' : '#dc3545',
+                        color: 'white',
+                        border: 'none',
+                        borderRadius: '5px',
+                        cursor: cancelling ? 'not-allowed' : 'pointer'
+                    }}
+                >
+                    {cancelling ? 'キャンセル中...' : '⏹ キャンセル'}
+                </button>
+            )}
+
+            {currentStage && (
+                <span style={{ marginLeft: '15px', fontSize: '14px', color: '#666' }}>
+                    ⏳ {currentStage}
+                </span>
+            )}
+
             {logSummary && (
                 <div style={{ marginTop: '20px', marginBottom: '40px' }}>
                     {/* Status Banner */}
@@ -322,10 +474,10 @@ export default function ScraperAdmin() {
                         borderRadius: '8px',
                         marginBottom: '20px',
                         backgroundColor: logSummary.status === 'success' ? '#d4edda' :
-                            logSummary.status === 'no_data' ? '#fff3cd' :
+                            logSummary.status === 'no_data' || logSummary.status === 'cancelled' ? '#fff3cd' :
                                 logSummary.status === 'error' ? '#f8d7da' : '#e2e3e5',
                         color: logSummary.status === 'success' ? '#155724' :
-                            logSummary.status === 'no_data' ? '#856404' :
+                            logSummary.status === 'no_data' || logSummary.status === 'cancelled' ? '#856404' :
                                 logSummary.status === 'error' ? '#721c24' : '#383d41',
                         display: 'flex',
                         alignItems: 'center',
@@ -333,7 +485,7 @@ export default function ScraperAdmin() {
                     }}>
                         <span style={{ fontSize: '24px' }}>
                             {logSummary.status === 'success' ? '✅' :
-                                logSummary.status === 'no_data' ? '⚠️' :
+                                logSummary.status === 'no_data' || logSummary.status === 'cancelled' ? '⚠️' :
                                     logSummary.status === 'error' ? '❌' : '⏳'}
                         </span>
                         <span style={{ fontSize: '16px', fontWeight: 'bold' }}>
@@ -390,6 +542,35 @@ export default function ScraperAdmin() {
                         </div>
                     )}
 
+                    {/* Per-post outcomes (streamed) */}
+                    {postOutcomes.length > 0 && (
+                        <div style={{ marginBottom: '20px' }}>
+                            <h4 style={{ marginBottom: '10px' }}>解析結果</h4>
+                            <table style={{ width: '100%', borderCollapse: 'collapse', textAlign: 'left', fontSize: '13px' }}>
+                                <tbody>
+                                    {postOutcomes.map((outcome) => (
+                                        <tr key={`${outcome.index}-${outcome.shortcode}`}>
+                                            <td style={{ padding: '6px', borderBottom: '1px solid #eee', color: '#999' }}>
+                                                {outcome.index}/{outcome.total}
+                                            </td>
+                                            <td style={{ padding: '6px', borderBottom: '1px solid #eee' }}>
+                                                <a href={`https://instagram.com/p/${outcome.shortcode}`} target="_blank" rel="noopener noreferrer">
+                                                    {outcome.shortcode}
+                                                </a>
+                                            </td>
+                                            <td style={{ padding: '6px', borderBottom: '1px solid #eee', color: outcome.category === 'Error' ? '#dc3545' : undefined }}>
+                                                {outcome.category}{outcome.error ? `: ${outcome.error}` : ''}
+                                            </td>
+                                            <td style={{ padding: '6px', borderBottom: '1px solid #eee', color: '#999', textAlign: 'right' }}>
+                                                {outcome.elapsed.toFixed(1)}s{outcome.tokens ? ` / ${outcome.tokens} tokens` : ''}
+                                            </td>
+                                        </tr>
+                                    ))}
+                                </tbody>
+                            </table>
+                        </div>
+                    )}
+
                     {/* Collapsible Raw Log */}
                     <details style={{ marginTop: '10px' }}>
                         <summary style={{ cursor: 'pointer', color: '#666', fontSize: '14px' }}>詳細ログを表示</summary>
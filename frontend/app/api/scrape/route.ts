@@ -1,10 +1,18 @@
 import { NextResponse } from 'next/server';
-import { exec } from 'child_process';
+import { spawn, ChildProcess } from 'child_process';
+import { randomUUID } from 'crypto';
 import path from 'path';
 
+// Streams for the whole run, so this must run on Node.js and never be cached
+export const runtime = 'nodejs';
+export const dynamic = 'force-dynamic';
+
+// Running scraper processes by run id, so DELETE can cancel a run while its stream stays open
+const runs = new Map<string, ChildProcess>();
+
 export async function POST(request: Request) {
   try {
-    const { country, daysFilter, maxPosts, skipDuplicates } = await request.json().catch(() => ({}));
+    const { country, daysFilter, maxPosts, skipDuplicates, tokenBudget } = await request.json().catch(() => ({}));
 
     // Security: Whitelist allowed countries to prevent command injection
     const ALLOWED_COUNTRIES = ['Toronto', 'Thailand', 'Philippines', 'UK', 'Australia'];
@@ -13,42 +21,135 @@ export async function POST(request: Request) {
     // Security: Validate numeric inputs
     const safeDaysFilter = typeof daysFilter === 'number' && daysFilter >= 1 && daysFilter <= 365 ? Math.floor(daysFilter) : 14;
     const safeMaxPosts = typeof maxPosts === 'number' && maxPosts >= 1 && maxPosts <= 50 ? Math.floor(maxPosts) : 10;
+    const safeTokenBudget = typeof tokenBudget === 'number' && tokenBudget >= 0 && tokenBudget <= 1000000 ? Math.floor(tokenBudget) : 0;
 
     // Determine the path to the main.py script
     // Assuming 'frontend' is in the project root, and main.py is in the parent directory
     const scriptPath = path.resolve(process.cwd(), '../main.py');
     const projectRoot = path.resolve(process.cwd(), '../');
 
-    // Build command with validated inputs only
-    let command = `python3 ${scriptPath}`;
-    command += ` --country "${safeCountry}"`;
-    command += ` --days ${safeDaysFilter}`;
-    command += ` --limit ${safeMaxPosts}`;
+    // Build arguments with validated inputs only (passed as argv, no shell involved)
+    // -u: unbuffered stdout so each log line / progress event arrives as it is printed
+    const args = [
+      '-u', scriptPath,
+      '--country', safeCountry,
+      '--days', String(safeDaysFilter),
+      '--limit', String(safeMaxPosts),
+      '--progress-json',
+    ];
 
     if (skipDuplicates === false) {
-      command += ` --no-skip-duplicates`;
+      args.push('--no-skip-duplicates');
+    }
+
+    // 0 = unlimited (main.py default)
+    if (safeTokenBudget > 0) {
+      args.push('--token-budget', String(safeTokenBudget));
     }
 
-    console.log(`Executing command: ${command}`);
-
-    // Execute the Python script
-    // We wrap it in a promise to await the result
-    const result = await new Promise<{ stdout: string; stderr: string }>((resolve, reject) => {
-      exec(command, { cwd: projectRoot }, (error, stdout, stderr) => {
-        if (error) {
-          console.error(`Exec error: ${error}`);
-          // We resolve even on error to return the stderr to the frontend
-          resolve({ stdout, stderr: stderr + "\n" + error.message });
-          return;
-        }
-        resolve({ stdout, stderr });
-      });
+    console.log(`Executing command: python3 ${args.join(' ')}`);
+
+    const encoder = new TextEncoder();
+    const runId = randomUUID();
+    let child: ChildProcess | null = null;
+    let closed = false;
+
+    // Relay the run as Server-Sent Events:
+    //   event: progress  -> JSON-lines progress events from main.py --progress-json
+    //   event: log       -> any other stdout/stderr line
+    //   event: end       -> process exit code / signal
+    const stream = new ReadableStream<Uint8Array>({
+      start(controller) {
+        const send = (event: string, data: unknown) => {
+          if (closed) return;
+          controller.enqueue(encoder.encode(`event: ${event}\ndata: ${JSON.stringify(data)}\n\n`));
+        };
+
+        const relayLine = (line: string, source: 'stdout' | 'stderr') => {
+          if (!line) return;
+          if (source === 'stdout' && line.startsWith('{')) {
+            try {
+              const parsed = JSON.parse(line);
+              if (parsed && parsed.type === 'progress') {
+                send('progress', parsed);
+                return;
+              }
+            } catch { }
+          }
+          send('log', { stream: source, line });
+        };
+
+        // Split chunked output into complete lines, keeping any partial tail for the next chunk
+        const lineReader = (source: 'stdout' | 'stderr') => {
+          let buffer = '';
+          return {
+            push(chunk: string) {
+              buffer += chunk;
+              const lines = buffer.split(/\r?\n/);
+              buffer = lines.pop() ?? '';
+              lines.forEach(line => relayLine(line, source));
+            },
+            flush() {
+              relayLine(buffer, source);
+              buffer = '';
+            },
+          };
+        };
+
+        const stdout = lineReader('stdout');
+        const stderr = lineReader('stderr');
+
+        child = spawn('python3', args, {
+          cwd: projectRoot,
+          env: { ...process.env, PYTHONUNBUFFERED: '1', PYTHONIOENCODING: 'utf-8' },
+        });
+        runs.set(runId, child);
+
+        // Keep draining output even after the client has gone, so a cancelled run
+        // can still finish saving without hitting a broken pipe
+        // setEncoding keeps multi-byte (Japanese) characters intact across chunk boundaries
+        child.stdout?.setEncoding('utf8');
+        child.stderr?.setEncoding('utf8');
+        child.stdout?.on('data', (chunk: string) => stdout.push(chunk));
+        child.stderr?.on('data', (chunk: string) => stderr.push(chunk));
+
+        child.on('error', (error) => {
+          console.error(`Spawn error: ${error}`);
+          send('log', { stream: 'stderr', line: error.message });
+        });
+
+        child.on('close', (code, signal) => {
+          runs.delete(runId);
+          stdout.flush();
+          stderr.flush();
+          send('end', { code, signal });
+          if (!closed) {
+            closed = true;
+            controller.close();
+          }
+        });
+
+        // Fallback: client disconnected without cancelling. The cancel button uses DELETE
+        // instead, so the stream stays open until main.py has saved and reported done
+        request.signal.addEventListener('abort', () => {
+          closed = true;
+          child?.kill('SIGTERM');
+        });
+      },
+      cancel() {
+        closed = true;
+        child?.kill('SIGTERM');
+      },
     });
 
-    return NextResponse.json({
-      success: true,
-      output: result.stdout,
-      error: result.stderr
+    return new Response(stream, {
+      headers: {
+        'Content-Type': 'text/event-stream; charset=utf-8',
+        'Cache-Control': 'no-cache, no-transform',
+        'Connection': 'keep-alive',
+        'X-Accel-Buffering': 'no',
+        'X-Run-Id': runId,
+      },
     });
 
   } catch (error: any) {
@@ -58,3 +159,20 @@ export async function POST(request: Request) {
     );
   }
 }
+
+// Cancel a running scrape: DELETE /api/scrape?runId=<X-Run-Id of the POST response>
+// main.py handles SIGTERM by saving what it has analyzed, then the POST stream ends as usual
+export async function DELETE(request: Request) {
+  const runId = new URL(request.url).searchParams.get('runId') || '';
+  const child = runs.get(runId);
+
+  if (!child) {
+    return NextResponse.json(
+      { success: false, error: 'Run not found or already finished' },
+      { status: 404 }
+    );
+  }
+
+  child.kill('SIGTERM');
+  return NextResponse.json({ success: true });
+}
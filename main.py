@@ -1,30 +1,62 @@
 import json
 import time
+import signal
+import progress
 from scraper import fetch_instagram_posts
-from analyzer import analyze_post
+from analyzer import analyze_post, attach_source_metadata, RATE_LIMIT_SECONDS
 from database import save_post
+from scoring import estimate_tokens
+from work_queue import enqueue_posts
 
 import argparse
 
 # Category priority: Job > House > Event > Ignore
 CATEGORY_PRIORITY = {"Job": 0, "House": 1, "Event": 2, "Ignore": 3, "Error": 4}
 
+# /api/scrape sends SIGTERM when the operator cancels a run. While fetching and
+# analyzing, the run is interrupted immediately; once posts are being saved or
+# enqueued, the cancel is only recorded so the write finishes.
+_cancel_requested = False
+
+def _raise_keyboard_interrupt(signum, frame):
+    global _cancel_requested
+    _cancel_requested = True
+    raise KeyboardInterrupt
+
+def _defer_cancel(signum, frame):
+    global _cancel_requested
+    _cancel_requested = True
+
 def main():
     parser = argparse.ArgumentParser(description="Toronto Info Scraper")
     parser.add_argument("--country", type=str, default="Toronto", help="Target country (e.g. Toronto, Thailand)")
     parser.add_argument("--days", type=int, default=14, help="Number of days to filter posts (default: 14)")
     parser.add_argument("--limit", type=int, default=10, help="Maximum number of posts to process (default: 10)")
     parser.add_argument("--no-skip-duplicates", action="store_true", help="Disable duplicate filtering")
+    parser.add_argument("--token-budget", type=int, default=0, help="Maximum Gemini tokens to spend per run (default: 0 = unlimited)")
+    parser.add_argument("--enqueue", action="store_true", help="Only fetch and enqueue posts for worker.py instead of analyzing them here")
+    parser.add_argument("--progress-json", action="store_true", help="Emit structured JSON-lines progress events on stdout (used by the admin UI)")
     args = parser.parse_args()
     
     skip_duplicates = not args.no_skip_duplicates
+    if args.progress_json:
+        progress.enable()
+    signal.signal(signal.SIGTERM, _defer_cancel)
+    run_started = time.monotonic()
     
     print(f"=== Starting Content Aggregator for {args.country} ===")
-    print(f"Settings: Days={args.days}, Limit={args.limit}, SkipDuplicates={skip_duplicates}")
+    print(f"Settings: Days={args.days}, Limit={args.limit}, SkipDuplicates={skip_duplicates}, TokenBudget={args.token_budget or 'unlimited'}")
+    progress.emit("start", country=args.country, days=args.days, limit=args.limit,
+                  skip_duplicates=skip_duplicates, token_budget=args.token_budget, enqueue=args.enqueue)
     
     # 1. Fetch Posts
     print("\n[1/3] Fetching posts from Instagram (Apify)...")
+    progress.emit("stage", stage="fetch", status="started")
+    stage_started = time.monotonic()
     try:
+        signal.signal(signal.SIGTERM, _raise_keyboard_interrupt)
+        if _cancel_requested:
+            raise KeyboardInterrupt
         posts = fetch_instagram_posts(
             country=args.country,
             days_filter=args.days,
@@ -32,51 +64,103 @@ def main():
             skip_duplicates=skip_duplicates
         )
         print(f"Found {len(posts)} potential posts.")
+    except KeyboardInterrupt:
+        print("Cancelled while fetching posts.")
+        progress.emit("done", status="cancelled", elapsed=time.monotonic() - run_started)
+        return
     except Exception as e:
         print(f"Error fetching posts: {e}")
+        progress.emit("done", status="error", message=str(e), elapsed=time.monotonic() - run_started)
         return
+    finally:
+        signal.signal(signal.SIGTERM, _defer_cancel)
+    progress.emit("stage", stage="fetch", status="finished", count=len(posts),
+                  elapsed=time.monotonic() - stage_started)
 
     if not posts:
         print("No posts found to process.")
+        progress.emit("done", status="no_data", elapsed=time.monotonic() - run_started)
         return
 
-    # 2. Analyze all posts first
+    if args.enqueue:
+        print("\nEnqueueing posts for analysis workers...")
+        enqueued = enqueue_posts(posts)
+        progress.emit("stage", stage="enqueue", status="finished", count=enqueued)
+        print("\n=== Execution Summary ===")
+        print(f"Total Fetched: {len(posts)}")
+        print(f"Enqueued: {enqueued}")
+        print("=== Done ===")
+        progress.emit("done", status="cancelled" if _cancel_requested else "success", fetched=len(posts), enqueued=enqueued,
+                      elapsed=time.monotonic() - run_started)
+        return
+
+    # 2. Analyze posts in priority order (scraper returns them highest score first)
     print("\n[2/3] Analyzing posts...")
+    progress.emit("stage", stage="analyze", status="started", total=len(posts))
+    stage_started = time.monotonic()
     analyzed_results = []
+    tokens_used = 0
+    skipped_budget = 0
+    cancelled = False
     
-    for i, post in enumerate(posts):
-        print(f"\n--- Analyzing Post {i+1}/{len(posts)} ---")
-        try:
-            print(f"Analyzing post from {post.get('username')}...")
-            analysis_result = analyze_post(post)
-            
-            category = analysis_result.get("category", "Error")
-            print(f"Category: {category}")
-            
-            if category == "Error":
-                print(f"Skipping due to analysis error: {analysis_result.get('error')}")
+    try:
+        signal.signal(signal.SIGTERM, _raise_keyboard_interrupt)
+        if _cancel_requested:
+            raise KeyboardInterrupt
+        for i, post in enumerate(posts):
+            estimated = estimate_tokens(post)
+            if args.token_budget and tokens_used + estimated > args.token_budget:
+                skipped_budget = len(posts) - i
+                print(f"\nToken budget exhausted ({tokens_used}/{args.token_budget}). Skipping {skipped_budget} lower-priority posts.")
+                progress.emit("budget_exhausted", tokens_used=tokens_used, token_budget=args.token_budget,
+                              skipped=skipped_budget)
+                break
+
+            print(f"\n--- Analyzing Post {i+1}/{len(posts)} (score {post.get('score', 0):.1f}) ---")
+            post_started = time.monotonic()
+            try:
+                print(f"Analyzing post from {post.get('username')}...")
+                analysis_result = analyze_post(post)
+                post_tokens = analysis_result.pop("token_count", estimated)
+                tokens_used += post_tokens
+                
+                category = analysis_result.get("category", "Error")
+                print(f"Category: {category}")
+                progress.emit("post", index=i + 1, total=len(posts), shortcode=post.get("shortcode"),
+                              author=post.get("username"), score=post.get("score", 0), category=category,
+                              error=analysis_result.get("error"), tokens=post_tokens,
+                              elapsed=time.monotonic() - post_started)
+                
+                if category == "Error":
+                    print(f"Skipping due to analysis error: {analysis_result.get('error')}")
+                    continue
+
+                analyzed_results.append(attach_source_metadata(analysis_result, post))
+                
+                time.sleep(RATE_LIMIT_SECONDS)
+                
+            except Exception as e:
+                print(f"Error processing post: {e}")
+                progress.emit("post", index=i + 1, total=len(posts), shortcode=post.get("shortcode"),
+                              author=post.get("username"), score=post.get("score", 0), category="Error",
+                              error=str(e), elapsed=time.monotonic() - post_started)
                 continue
+    except KeyboardInterrupt:
+        # Keep what has already been paid for: save the posts analyzed so far
+        cancelled = True
+        print(f"\nCancelled. Saving {len(analyzed_results)} posts analyzed so far.")
+        progress.emit("cancelled", analyzed=len(analyzed_results))
+    finally:
+        # From here on, only record cancellation: the analyzed posts must be saved
+        signal.signal(signal.SIGTERM, _defer_cancel)
 
-            # Preserve metadata from source post
-            if "data" not in analysis_result:
-                analysis_result["data"] = {}
-            
-            analysis_result["data"]["instagram_shortcode"] = post.get("shortcode")
-            analysis_result["data"]["original_url"] = post.get("postUrl")
-            analysis_result["data"]["posted_at"] = post.get("timestamp")
-            analysis_result["data"]["author"] = post.get("username")
-            
-            analyzed_results.append(analysis_result)
-            
-            # Respect rate limits (Gemini Free Tier is ~15 RPM)
-            time.sleep(20)
-            
-        except Exception as e:
-            print(f"Error processing post: {e}")
-            continue
+    progress.emit("stage", stage="analyze", status="finished", count=len(analyzed_results),
+                  tokens_used=tokens_used, elapsed=time.monotonic() - stage_started)
 
     # 3. Sort by category priority (Job > House > Event > Ignore)
     print("\n[3/3] Sorting by priority and saving...")
+    progress.emit("stage", stage="save", status="started", total=len(analyzed_results))
+    stage_started = time.monotonic()
     analyzed_results.sort(key=lambda x: CATEGORY_PRIORITY.get(x.get("category", "Ignore"), 3))
     
     # Count by category
@@ -89,19 +173,30 @@ def main():
     # Save sorted results
     saved_count = 0
     for result in analyzed_results:
-        if save_post(result):
+        saved = save_post(result)
+        if saved:
             print(f"Saved {result.get('category')} post: {result.get('data', {}).get('instagram_shortcode')}")
             saved_count += 1
         else:
             print("Failed to save.")
+        progress.emit("saved", shortcode=result.get("data", {}).get("instagram_shortcode"),
+                      category=result.get("category"), ok=saved)
+    progress.emit("stage", stage="save", status="finished", count=saved_count,
+                  elapsed=time.monotonic() - stage_started)
 
     # Summary
     print("\n=== Execution Summary ===")
     print(f"Total Fetched: {len(posts)}")
     print(f"Analyzed: {len(analyzed_results)}")
+    print(f"Tokens Used: {tokens_used}" + (f" / {args.token_budget}" if args.token_budget else ""))
+    print(f"Skipped (budget): {skipped_budget}")
     print(f"Saved to DB: {saved_count}")
     print(f"Priority order: Job({category_counts.get('Job', 0)}) > House({category_counts.get('House', 0)}) > Event({category_counts.get('Event', 0)}) > Ignore({category_counts.get('Ignore', 0)})")
     print("=== Done ===")
+    progress.emit("done", status="cancelled" if cancelled or _cancel_requested else "success", fetched=len(posts),
+                  analyzed=len(analyzed_results), saved=saved_count, skipped_budget=skipped_budget,
+                  tokens_used=tokens_used, categories=category_counts,
+                  elapsed=time.monotonic() - run_started)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,26 @@
+import json
+import time
+
+# =====================================
+# 構造化進捗イベント（JSON Lines）
+#
+# main.py --progress-json のとき、通常のログ行に混ざって
+# {"type": "progress", "event": ...} 形式の1行JSONを標準出力に書き出す。
+# /api/scrape はこの行を Server-Sent Events として管理画面に中継する。
+# =====================================
+
+ENABLED = False
+
+
+def enable():
+    global ENABLED
+    ENABLED = True
+
+
+def emit(event, **fields):
+    """Writes one progress event as a JSON line (no-op unless enabled)."""
+    if not ENABLED:
+        return
+    payload = {"type": "progress", "event": event, "ts": time.time()}
+    payload.update(fields)
+    print(json.dumps(payload, ensure_ascii=False, default=str), flush=True)
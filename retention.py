@@ -0,0 +1,98 @@
+import argparse
+
+from database import supabase
+
+# =====================================
+# 保持期間（カテゴリ別）
+#
+# 求人・住居情報は数週間で古くなるため、posted_at が保持期間を過ぎた行を
+# posts から posts_archive に移動する（archive=False のカテゴリは削除のみ）。
+# どちらの場合も shortcode は seen_shortcodes に残し、再取得を防ぐ。
+# =====================================
+RETENTION_POLICY = {
+    "Job":    {"days": 30, "archive": True},
+    "House":  {"days": 30, "archive": True},
+    "Event":  {"days": 14, "archive": True},
+    "Ignore": {"days": 7,  "archive": False},
+}
+
+QUEUE_RETENTION_DAYS = 7      # done/failed rows in post_queue
+ARCHIVE_RETENTION_DAYS = 365  # rows in posts_archive (0 = keep forever)
+
+
+def parse_overrides(values):
+    """Parses repeated --retention CATEGORY=DAYS arguments into {category: days}."""
+    overrides = {}
+    for value in values or []:
+        category, sep, days = value.partition("=")
+        if not sep or not days.isdigit():
+            raise argparse.ArgumentTypeError(f"Invalid --retention value: {value} (expected CATEGORY=DAYS)")
+        overrides[category] = int(days)
+    return overrides
+
+
+def apply_retention(policy, queue_days=QUEUE_RETENTION_DAYS, archive_days=ARCHIVE_RETENTION_DAYS):
+    """
+    Runs the retention SQL functions for each category in policy.
+    Returns a dict of category -> rows moved out of posts (plus queue/archive counts).
+    """
+    if not supabase:
+        print("Supabase client not initialized.")
+        return {}
+
+    results = {}
+    for category, rule in policy.items():
+        try:
+            result = supabase.rpc("archive_expired_posts", {
+                "p_category": category,
+                "p_days": rule["days"],
+                "p_archive": rule["archive"],
+            }).execute()
+            results[category] = result.data or 0
+            action = "Archived" if rule["archive"] else "Dropped"
+            print(f"{action} {results[category]} {category} posts older than {rule['days']} days.")
+        except Exception as e:
+            print(f"Error applying retention to {category}: {e}")
+
+    try:
+        result = supabase.rpc("prune_post_queue", {"p_days": queue_days}).execute()
+        results["post_queue"] = result.data or 0
+        print(f"Pruned {results['post_queue']} finished queue rows older than {queue_days} days.")
+    except Exception as e:
+        print(f"Error pruning post_queue: {e}")
+
+    if archive_days:
+        try:
+            result = supabase.rpc("purge_posts_archive", {"p_days": archive_days}).execute()
+            results["posts_archive"] = result.data or 0
+            print(f"Purged {results['posts_archive']} archived posts older than {archive_days} days.")
+        except Exception as e:
+            print(f"Error purging posts_archive: {e}")
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Toronto Info Scraper - retention job")
+    parser.add_argument("--retention", action="append", metavar="CATEGORY=DAYS", help="Override retention days for a category (repeatable, e.g. --retention Job=45)")
+    parser.add_argument("--queue-days", type=int, default=QUEUE_RETENTION_DAYS, help=f"Days to keep finished post_queue rows (default: {QUEUE_RETENTION_DAYS})")
+    parser.add_argument("--archive-days", type=int, default=ARCHIVE_RETENTION_DAYS, help=f"Days to keep rows in posts_archive, 0 = forever (default: {ARCHIVE_RETENTION_DAYS})")
+    args = parser.parse_args()
+
+    try:
+        overrides = parse_overrides(args.retention)
+    except argparse.ArgumentTypeError as e:
+        parser.error(str(e))
+
+    policy = {category: dict(rule) for category, rule in RETENTION_POLICY.items()}
+    for category, days in overrides.items():
+        policy.setdefault(category, {"archive": True})["days"] = days
+
+    print("=== Starting Retention Job ===")
+    print("Policy: " + ", ".join(f"{c}={r['days']}d" + ("" if r["archive"] else " (drop)") for c, r in policy.items()))
+
+    apply_retention(policy, args.queue_days, args.archive_days)
+    print("=== Done ===")
+
+if __name__ == "__main__":
+    main()
@@ -37,3 +37,237 @@ FOR ALL
 TO anon
 USING (true)
 WITH CHECK (true);
+
+-- =====================================
+-- Analysis work queue (main.py --enqueue -> worker.py)
+-- =====================================
+-- Fetched-but-unanalyzed posts. Workers lease batches with claim_post_queue();
+-- a lease that expires (dead worker) makes the row claimable again.
+CREATE TABLE public.post_queue (
+    id BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+    instagram_shortcode TEXT NOT NULL UNIQUE,
+    payload JSONB NOT NULL,                -- formatted post from scraper.py
+    score REAL DEFAULT 0,                  -- scoring.py priority (highest first)
+    status TEXT DEFAULT 'queued',          -- queued/leased/done/failed
+    attempts INT DEFAULT 0,
+    lease_owner TEXT,
+    lease_expires_at TIMESTAMP WITH TIME ZONE,
+    last_error TEXT,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT timezone('utc'::text, now()) NOT NULL
+);
+
+CREATE INDEX post_queue_claim_idx ON public.post_queue (status, score DESC, id);
+
+ALTER TABLE public.post_queue ENABLE ROW LEVEL SECURITY;
+
+-- Same access model as posts: the backend scripts use the anon key
+CREATE POLICY "Allow anon insert/update"
+ON public.post_queue
+FOR ALL
+TO anon
+USING (true)
+WITH CHECK (true);
+
+-- Lease up to p_batch_size rows for p_worker. FOR UPDATE SKIP LOCKED lets any
+-- number of workers call this concurrently without blocking or double-claiming.
+-- Expired leases that already used their last attempt (the worker died on it)
+-- are marked failed first, so they never stay 'leased' forever.
+CREATE OR REPLACE FUNCTION public.claim_post_queue(
+    p_worker TEXT,
+    p_batch_size INT,
+    p_lease_seconds INT,
+    p_max_attempts INT DEFAULT 3
+)
+RETURNS SETOF public.post_queue
+LANGUAGE sql
+AS $$
+    UPDATE public.post_queue
+    SET status = 'failed',
+        lease_owner = NULL,
+        lease_expires_at = NULL,
+        last_error = 'lease expired on final attempt'
+    WHERE status = 'leased'
+      AND lease_expires_at < now()
+      AND attempts >= p_max_attempts;
+
+    UPDATE public.post_queue q
+    SET status = 'leased',
+        lease_owner = p_worker,
+        lease_expires_at = now() + make_interval(secs => p_lease_seconds),
+        attempts = q.attempts + 1
+    WHERE q.id IN (
+        SELECT id
+        FROM public.post_queue
+        WHERE (status = 'queued' OR (status = 'leased' AND lease_expires_at < now()))
+          AND attempts < p_max_attempts
+        ORDER BY score DESC, id
+        LIMIT p_batch_size
+        FOR UPDATE SKIP LOCKED
+    )
+    RETURNING q.*;
+$$;
+
+-- Extend the lease on rows p_worker still holds. Returns the number of rows renewed.
+CREATE OR REPLACE FUNCTION public.renew_post_queue_lease(
+    p_worker TEXT,
+    p_ids BIGINT[],
+    p_lease_seconds INT
+)
+RETURNS INT
+LANGUAGE sql
+AS $$
+    WITH renewed AS (
+        UPDATE public.post_queue
+        SET lease_expires_at = now() + make_interval(secs => p_lease_seconds)
+        WHERE id = ANY(p_ids)
+          AND lease_owner = p_worker
+          AND status = 'leased'
+        RETURNING id
+    )
+    SELECT count(*)::INT FROM renewed;
+$$;
+
+-- =====================================
+-- Retention: hot/cold split on posted_at (retention.py)
+-- =====================================
+-- posts keeps only fresh rows; expired rows move to posts_archive, and every
+-- retired shortcode is kept in seen_shortcodes so the scraper still skips it.
+-- Expression index matching the COALESCE(posted_at, created_at) filter in archive_expired_posts()
+CREATE INDEX posts_category_posted_at_idx ON public.posts (category, (COALESCE(posted_at, created_at)));
+
+CREATE TABLE public.posts_archive (
+    id BIGINT PRIMARY KEY,
+    instagram_shortcode TEXT NOT NULL UNIQUE,
+    status TEXT,
+    category TEXT,
+    original_url TEXT,
+    posted_at TIMESTAMP WITH TIME ZONE,
+    author TEXT,
+    content TEXT,
+    details JSONB,
+    created_at TIMESTAMP WITH TIME ZONE NOT NULL,
+    archived_at TIMESTAMP WITH TIME ZONE DEFAULT timezone('utc'::text, now()) NOT NULL
+);
+
+CREATE INDEX posts_archive_archived_at_idx ON public.posts_archive (archived_at);
+
+-- Compact dedup index: one short row per shortcode that left posts/post_queue
+CREATE TABLE public.seen_shortcodes (
+    instagram_shortcode TEXT PRIMARY KEY,
+    retired_at TIMESTAMP WITH TIME ZONE DEFAULT timezone('utc'::text, now()) NOT NULL
+);
+
+ALTER TABLE public.posts_archive ENABLE ROW LEVEL SECURITY;
+ALTER TABLE public.seen_shortcodes ENABLE ROW LEVEL SECURITY;
+
+CREATE POLICY "Allow anon insert/update"
+ON public.posts_archive
+FOR ALL
+TO anon
+USING (true)
+WITH CHECK (true);
+
+CREATE POLICY "Allow anon insert/update"
+ON public.seen_shortcodes
+FOR ALL
+TO anon
+USING (true)
+WITH CHECK (true);
+
+-- Move posts of p_category older than p_days (by posted_at, falling back to
+-- created_at) out of posts. With p_archive = false the rows are dropped and only
+-- their shortcodes are kept. Returns the number of rows removed from posts.
+CREATE OR REPLACE FUNCTION public.archive_expired_posts(
+    p_category TEXT,
+    p_days INT,
+    p_archive BOOLEAN DEFAULT true
+)
+RETURNS INT
+LANGUAGE sql
+AS $$
+    WITH moved AS (
+        DELETE FROM public.posts
+        WHERE category = p_category
+          AND COALESCE(posted_at, created_at) < now() - make_interval(days => p_days)
+        RETURNING *
+    ), archived AS (
+        INSERT INTO public.posts_archive
+            (id, instagram_shortcode, status, category, original_url, posted_at, author, content, details, created_at)
+        SELECT id, instagram_shortcode, status, category, original_url, posted_at, author, content, details, created_at
+        FROM moved
+        WHERE p_archive
+        -- A shortcode archived earlier and saved again since: keep the newer row
+        ON CONFLICT (instagram_shortcode) DO UPDATE
+        SET id = EXCLUDED.id,
+            status = EXCLUDED.status,
+            category = EXCLUDED.category,
+            original_url = EXCLUDED.original_url,
+            posted_at = EXCLUDED.posted_at,
+            author = EXCLUDED.author,
+            content = EXCLUDED.content,
+            details = EXCLUDED.details,
+            created_at = EXCLUDED.created_at,
+            archived_at = EXCLUDED.archived_at
+    ), seen AS (
+        INSERT INTO public.seen_shortcodes (instagram_shortcode)
+        SELECT instagram_shortcode FROM moved
+        ON CONFLICT (instagram_shortcode) DO NOTHING
+    )
+    SELECT count(*)::INT FROM moved;
+$$;
+
+-- Drop finished (done/failed) queue rows older than p_days, keeping their shortcodes.
+CREATE OR REPLACE FUNCTION public.prune_post_queue(p_days INT)
+RETURNS INT
+LANGUAGE sql
+AS $$
+    WITH pruned AS (
+        DELETE FROM public.post_queue
+        WHERE status IN ('done', 'failed')
+          AND created_at < now() - make_interval(days => p_days)
+        RETURNING instagram_shortcode
+    ), seen AS (
+        INSERT INTO public.seen_shortcodes (instagram_shortcode)
+        SELECT instagram_shortcode FROM pruned
+        ON CONFLICT (instagram_shortcode) DO NOTHING
+    )
+    SELECT count(*)::INT FROM pruned;
+$$;
+
+-- Delete archived rows older than p_days (their shortcodes stay in seen_shortcodes).
+CREATE OR REPLACE FUNCTION public.purge_posts_archive(p_days INT)
+RETURNS INT
+LANGUAGE sql
+AS $$
+    WITH purged AS (
+        DELETE FROM public.posts_archive
+        WHERE archived_at < now() - make_interval(days => p_days)
+        RETURNING id
+    )
+    SELECT count(*)::INT FROM purged;
+$$;
+
+-- =====================================
+-- Author history for analysis prioritization (scoring.py)
+-- =====================================
+-- Past Job/House posts per author across posts and posts_archive. Counted here
+-- rather than client-side so the result is one row per author, never truncated
+-- by the API row limit.
+CREATE INDEX posts_author_idx ON public.posts (author);
+CREATE INDEX posts_archive_author_idx ON public.posts_archive (author);
+
+CREATE OR REPLACE FUNCTION public.author_hit_counts(p_authors TEXT[])
+RETURNS TABLE (author TEXT, hits INT)
+LANGUAGE sql
+STABLE
+AS $$
+    SELECT history.author, count(*)::INT
+    FROM (
+        SELECT p.author FROM public.posts p
+        WHERE p.category IN ('Job', 'House') AND p.author = ANY(p_authors)
+        UNION ALL
+        SELECT a.author FROM public.posts_archive a
+        WHERE a.category IN ('Job', 'House') AND a.author = ANY(p_authors)
+    ) history
+    GROUP BY history.author;
+$$;
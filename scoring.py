@@ -0,0 +1,164 @@
+import re
+from urllib.parse import unquote
+
+# =====================================
+# 解析対象の優先度スコアリング
+#
+# Gemini の呼び出し回数は有限なので、取得した投稿のうち
+# Job / House である可能性が高いものから順に解析する。
+# =====================================
+
+# Caption keyword signals. ASCII keywords match whole words (plus a plural "s"),
+# Japanese keywords match as substrings since Japanese has no word separators.
+JOB_KEYWORDS = [
+    "hiring", "job", "recruit", "recruiting", "looking for", "we're hiring", "part-time",
+    "full-time", "per hour", "/hr", "salary", "server", "cook", "chef", "barista",
+    "dishwasher", "cashier", "staff",
+    "求人", "募集", "採用", "急募", "仕事", "就職", "転職", "時給", "給与",
+    "アルバイト", "バイト", "パート", "正社員", "未経験", "経験者", "まかない", "シフト",
+]
+
+HOUSE_KEYWORDS = [
+    "rent", "rental", "for rent", "room available", "roommate", "housemate", "housing",
+    "condo", "flat", "roomshare", "sublet", "/month", "utilities", "move in",
+    "賃貸", "家賃", "部屋", "入居", "シェアハウス", "シェアメイト", "ルームメイト",
+    "ルームシェア", "不動産", "コンドミニアム", "光熱費",
+]
+
+# Signals that usually mean food photos / promotions (see analyzer prompt)
+NOISE_KEYWORDS = [
+    "menu", "new menu", "happy hour", "% off", "delicious", "yummy", "foodie",
+    "新メニュー", "期間限定", "キャンペーン", "ラーメン", "寿司", "ランチ", "美味しい",
+]
+
+# Hashtag signals. Hashtags are compounds like "torontojobs" / "hiringtoronto",
+# so ASCII keywords match as a suffix (or prefix) of the tag, never in the middle.
+JOB_TAG_SUFFIXES = ["jobs", "job", "hiring", "recruit", "recruiting", "work", "works"]
+JOB_TAG_PREFIXES = ["hiring"]
+# "...work" compounds that are not about jobs
+JOB_TAG_EXCLUDES = ["artwork", "homework", "network", "fireworks", "nailwork", "teamwork"]
+JOB_TAG_KEYWORDS_JA = ["求人", "仕事", "就職", "転職", "採用", "バイト"]
+
+HOUSE_TAG_SUFFIXES = [
+    "rentals", "rental", "forrent", "housing", "roommate", "roommates", "roomshare",
+    "flat", "flats", "condo", "condos", "apartment", "apartments", "sharehouse",
+]
+HOUSE_TAG_PREFIXES = []
+HOUSE_TAG_KEYWORDS_JA = ["賃貸", "シェアハウス", "部屋", "不動産", "コンドミニアム", "ルームシェア"]
+
+# Score weights
+SOURCE_JOB_WEIGHT = 3.0       # post was found via a job hashtag
+SOURCE_HOUSE_WEIGHT = 2.0     # post was found via a housing hashtag
+CAPTION_HASHTAG_WEIGHT = 1.0  # per job/house hashtag in the caption (capped)
+KEYWORD_WEIGHT = 1.5          # per job/house keyword in the caption (capped)
+NOISE_WEIGHT = 1.0            # per noise keyword in the caption (capped)
+AUTHOR_HIT_WEIGHT = 2.0       # per past Job/House post by the same author (capped)
+MAX_SIGNAL_COUNT = 3
+
+# Token estimation for the per-run analysis budget
+PROMPT_TOKENS = 900           # classifier prompt in analyzer.analyze_post
+IMAGE_TOKENS = 258            # Gemini bills a single image as a fixed 258 tokens
+OUTPUT_TOKENS = 150           # typical JSON response
+CHARS_PER_TOKEN = 3           # conservative for mixed Japanese/English captions
+
+
+def _keyword_pattern(keyword):
+    if not keyword.isascii():
+        return re.compile(re.escape(keyword))
+    # Word boundaries only where the keyword edge is a word character ("/hr" may follow "$20")
+    start = r"\b" if keyword[0].isalnum() else ""
+    end = r"s?\b" if keyword[-1].isalnum() else ""
+    return re.compile(start + re.escape(keyword) + end)
+
+
+def _compile(keywords):
+    return [_keyword_pattern(keyword) for keyword in keywords]
+
+
+JOB_PATTERNS = _compile(JOB_KEYWORDS)
+HOUSE_PATTERNS = _compile(HOUSE_KEYWORDS)
+NOISE_PATTERNS = _compile(NOISE_KEYWORDS)
+
+
+def _count_matches(text, patterns):
+    text = text.lower()
+    return sum(1 for pattern in patterns if pattern.search(text))
+
+
+def _tag_matches(tag, suffixes, prefixes, keywords_ja):
+    return (
+        tag.endswith(tuple(suffixes))
+        or tag.startswith(tuple(prefixes))
+        or any(keyword in tag for keyword in keywords_ja)
+    )
+
+
+def hashtag_kind(tag):
+    """Classifies a hashtag (without '#') as "Job", "House" or None."""
+    tag = unquote(tag or "").lower().lstrip("#")
+    if not tag:
+        return None
+    if _tag_matches(tag, JOB_TAG_SUFFIXES, JOB_TAG_PREFIXES, JOB_TAG_KEYWORDS_JA) \
+            and not tag.endswith(tuple(JOB_TAG_EXCLUDES)):
+        return "Job"
+    if _tag_matches(tag, HOUSE_TAG_SUFFIXES, HOUSE_TAG_PREFIXES, HOUSE_TAG_KEYWORDS_JA):
+        return "House"
+    return None
+
+
+def source_hashtag(input_url):
+    """Extracts the searched hashtag from an Apify inputUrl (.../explore/tags/<tag>/), URL-decoded."""
+    if not input_url:
+        return None
+    match = re.search(r"/explore/tags/([^/?#]+)", input_url)
+    return unquote(match.group(1)) if match else None
+
+
+def score_post(post, author_hits=None):
+    """
+    Returns the expected value of analyzing a post (higher = analyze first).
+
+    Args:
+        post: formatted post dict from scraper.fetch_instagram_posts
+        author_hits: dict of username -> number of past Job/House posts
+    """
+    author_hits = author_hits or {}
+    text = post.get("text", "") or ""
+    score = 0.0
+
+    source_kind = hashtag_kind(post.get("sourceHashtag"))
+    if source_kind == "Job":
+        score += SOURCE_JOB_WEIGHT
+    elif source_kind == "House":
+        score += SOURCE_HOUSE_WEIGHT
+
+    tag_hits = sum(1 for t in post.get("hashtags") or [] if hashtag_kind(t))
+    score += CAPTION_HASHTAG_WEIGHT * min(tag_hits, MAX_SIGNAL_COUNT)
+
+    keyword_hits = _count_matches(text, JOB_PATTERNS) + _count_matches(text, HOUSE_PATTERNS)
+    score += KEYWORD_WEIGHT * min(keyword_hits, MAX_SIGNAL_COUNT)
+
+    noise_hits = _count_matches(text, NOISE_PATTERNS)
+    score -= NOISE_WEIGHT * min(noise_hits, MAX_SIGNAL_COUNT)
+
+    hits = author_hits.get(post.get("username"), 0)
+    score += AUTHOR_HIT_WEIGHT * min(hits, MAX_SIGNAL_COUNT)
+
+    return score
+
+
+def rank_posts(posts, author_hits=None):
+    """Sorts posts by score (highest first) and stores it under post['score']."""
+    for post in posts:
+        post["score"] = score_post(post, author_hits)
+    # sorted() is stable, so equal scores keep dataset order
+    return sorted(posts, key=lambda p: p["score"], reverse=True)
+
+
+def estimate_tokens(post, use_vision=True):
+    """Rough upper estimate of the Gemini tokens analyze_post will consume for a post."""
+    text = post.get("text", "") or ""
+    tokens = PROMPT_TOKENS + OUTPUT_TOKENS + len(text) // CHARS_PER_TOKEN
+    if use_vision and post.get("imageUrl"):
+        tokens += IMAGE_TOKENS
+    return tokens
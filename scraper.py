@@ -3,6 +3,8 @@ import requests
 import json
 from dotenv import load_dotenv
 from supabase import create_client
+from scoring import rank_posts, source_hashtag, hashtag_kind
+import progress
 
 # Load environment variables
 load_dotenv()
@@ -13,19 +15,61 @@ APIFY_TOKEN = os.getenv("APIFY_TOKEN")
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_KEY")
 
-def get_existing_shortcodes():
-    """Fetch existing shortcodes from DB to avoid duplicate processing."""
-    if not SUPABASE_URL or not SUPABASE_KEY:
+# Tables whose shortcodes count as "already seen" (saved, queued, or retired by retention.py)
+DEDUP_TABLES = ("posts", "post_queue", "seen_shortcodes")
+DEDUP_CHUNK_SIZE = 200  # shortcodes per IN (...) filter, keeps request URLs short
+
+def get_existing_shortcodes(shortcodes):
+    """Return which of the given shortcodes are already known to the DB, to avoid duplicate processing."""
+    if not SUPABASE_URL or not SUPABASE_KEY or not shortcodes:
         return set()
     try:
         supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
-        result = supabase.table("posts").select("instagram_shortcode").execute()
-        return {row["instagram_shortcode"] for row in result.data if row.get("instagram_shortcode")}
     except Exception as e:
         print(f"Warning: Could not fetch existing shortcodes: {e}")
         return set()
+    candidates = list(shortcodes)
+    existing = set()
+    for table in DEDUP_TABLES:
+        try:
+            for i in range(0, len(candidates), DEDUP_CHUNK_SIZE):
+                chunk = candidates[i:i + DEDUP_CHUNK_SIZE]
+                result = supabase.table(table).select("instagram_shortcode").in_("instagram_shortcode", chunk).execute()
+                existing.update(row["instagram_shortcode"] for row in result.data if row.get("instagram_shortcode"))
+        except Exception as e:
+            print(f"Warning: Could not fetch existing shortcodes from {table}: {e}")
+    return existing
+
+def get_author_hit_counts(authors):
+    """Count past Job/House posts per author (including archived ones), used to prioritize known posters."""
+    if not SUPABASE_URL or not SUPABASE_KEY or not authors:
+        return {}
+    try:
+        supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
+    except Exception as e:
+        print(f"Warning: Could not fetch author history: {e}")
+        return {}
+    candidates = list(authors)
+    counts = {}
+    try:
+        # author_hit_counts() (schema.sql) counts over posts + posts_archive server-side,
+        # so each chunk returns at most one row per author
+        for i in range(0, len(candidates), DEDUP_CHUNK_SIZE):
+            chunk = candidates[i:i + DEDUP_CHUNK_SIZE]
+            result = supabase.rpc("author_hit_counts", {"p_authors": chunk}).execute()
+            for row in result.data or []:
+                counts[row["author"]] = counts.get(row["author"], 0) + row["hits"]
+    except Exception as e:
+        print(f"Warning: Could not fetch author history: {e}")
+    return counts
+
 APIFY_ACTOR_ID = "apify~instagram-hashtag-scraper"  # Official Apify Instagram Scraper
 
+# Hashtags searched per run (5 in total to avoid overload): mix job and housing tags
+# so both kinds of posts reach the scoring stage
+SEARCH_JOB_HASHTAGS = 3
+SEARCH_HOUSE_HASHTAGS = 2
+
 # =====================================
 # 求人/住居情報に特化したターゲット設定
 # 
@@ -151,6 +195,17 @@ COUNTRY_TARGETS = {
     }
 }
 
+def abort_apify_run(run_id):
+    """Aborts a running Apify actor run."""
+    try:
+        response = requests.post(f"https://api.apify.com/v2/actor-runs/{run_id}/abort?token={APIFY_TOKEN}", timeout=10)
+        if response.status_code == 200:
+            print(f"Aborted Apify run {run_id}.")
+        else:
+            print(f"Error aborting Apify run {run_id}: {response.text}")
+    except Exception as e:
+        print(f"Error aborting Apify run {run_id}: {e}")
+
 def fetch_instagram_posts(country="Toronto", days_filter=14, max_posts=10, skip_duplicates=True):
     """
     Fetches Instagram posts using Apify's Instagram Scraper.
@@ -171,11 +226,14 @@ def fetch_instagram_posts(country="Toronto", days_filter=14, max_posts=10, skip_
     
     hashtags = target_data.get("hashtags", [])
     accounts = target_data.get("accounts", [])
+    job_hashtags = [tag for tag in hashtags if hashtag_kind(tag) == "Job"]
+    house_hashtags = [tag for tag in hashtags if hashtag_kind(tag) == "House"]
+    search_hashtags = job_hashtags[:SEARCH_JOB_HASHTAGS] + house_hashtags[:SEARCH_HOUSE_HASHTAGS]
     
     # Configuration for apify/instagram-hashtag-scraper
     # Reference: https://apify.com/apify/instagram-hashtag-scraper
     actor_input = {
-        "hashtags": hashtags[:5],  # Use first 5 hashtags to avoid overload
+        "hashtags": search_hashtags or hashtags[:5],
         "resultsLimit": 50,        # Posts per hashtag
         "proxy": {
             "useApifyProxy": True,
@@ -201,16 +259,22 @@ def fetch_instagram_posts(country="Toronto", days_filter=14, max_posts=10, skip_
     
     # Wait for run to finish (Polling)
     import time
-    while True:
-        status_url = f"https://api.apify.com/v2/acts/{APIFY_ACTOR_ID}/runs/{run_id}?token={APIFY_TOKEN}"
-        status_response = requests.get(status_url)
-        status_data = status_response.json().get("data")
-        status = status_data.get("status")
-        
-        print(f"Status: {status}")
-        if status in ["SUCCEEDED", "FAILED", "ABORTED"]:
-            break
-        time.sleep(5)
+    try:
+        while True:
+            status_url = f"https://api.apify.com/v2/acts/{APIFY_ACTOR_ID}/runs/{run_id}?token={APIFY_TOKEN}"
+            status_response = requests.get(status_url)
+            status_data = status_response.json().get("data")
+            status = status_data.get("status")
+            
+            print(f"Status: {status}")
+            progress.emit("apify_status", run_id=run_id, status=status)
+            if status in ["SUCCEEDED", "FAILED", "ABORTED"]:
+                break
+            time.sleep(5)
+    except KeyboardInterrupt:
+        # Cancelled by the operator: stop the actor too, otherwise it keeps running (and billing)
+        abort_apify_run(run_id)
+        raise
         
     if status != "SUCCEEDED":
         print("Run failed or was aborted.")
@@ -231,9 +295,10 @@ def fetch_instagram_posts(country="Toronto", days_filter=14, max_posts=10, skip_
     warnings.filterwarnings("ignore", category=FutureWarning)
     
     # Get existing shortcodes to skip duplicates
-    existing_shortcodes = get_existing_shortcodes() if skip_duplicates else set()
+    candidate_shortcodes = {post.get("shortCode") for post in posts if post.get("shortCode")}
+    existing_shortcodes = get_existing_shortcodes(candidate_shortcodes) if skip_duplicates else set()
     if skip_duplicates:
-        print(f"Found {len(existing_shortcodes)} existing posts in database.")
+        print(f"Found {len(existing_shortcodes)} of {len(candidate_shortcodes)} fetched posts already in database.")
     else:
         print("Duplicate filtering disabled.")
     
@@ -276,16 +341,24 @@ def fetch_instagram_posts(country="Toronto", days_filter=14, max_posts=10, skip_
             "postUrl": f"https://www.instagram.com/p/{shortcode}/",
             "timestamp": timestamp_str,
             "username": post.get("ownerUsername"),
-            "shortcode": shortcode
+            "shortcode": shortcode,
+            "hashtags": post.get("hashtags") or [],
+            "sourceHashtag": source_hashtag(post.get("inputUrl"))
         }
         formatted_posts.append(formatted_post)
     
+    # Rank by expected value (Job/House likelihood) so the limit keeps the best candidates
+    author_hits = get_author_hit_counts({p["username"] for p in formatted_posts if p.get("username")})
+    ranked_posts = rank_posts(formatted_posts, author_hits)
+
     # Limit to max_posts to save API costs
-    final_posts = formatted_posts[:max_posts]
+    final_posts = ranked_posts[:max_posts]
     
     print(f"Skipped {skipped_duplicates} duplicate posts.")
     print(f"Skipped {skipped_old} old posts (older than {days_filter} days).")
     print(f"Retained {len(final_posts)} new posts for processing (Max {max_posts}).")
+    progress.emit("filter", raw=len(posts), duplicates=skipped_duplicates, old=skipped_old,
+                  retained=len(final_posts), max_posts=max_posts)
     return final_posts
 
 if __name__ == "__main__":
@@ -0,0 +1,165 @@
+from database import supabase
+
+# =====================================
+# 解析待ち投稿のキュー（post_queue テーブル）
+#
+# main.py --enqueue が取得済み・未解析の投稿を積み、
+# 任意の数の worker.py がリース付きでバッチを取得して解析する。
+# リースが切れた行（停止したワーカーの分）は次の claim で再取得される。
+# =====================================
+
+QUEUE_TABLE = "post_queue"
+
+
+def enqueue_posts(posts):
+    """
+    Adds fetched posts to the queue. Shortcodes already queued are ignored.
+    Returns the number of newly queued posts.
+    """
+    if not supabase:
+        print("Supabase client not initialized.")
+        return 0
+
+    rows = [
+        {
+            "instagram_shortcode": post["shortcode"],
+            "payload": post,
+            "score": post.get("score", 0),
+            "status": "queued",
+        }
+        for post in posts
+        if post.get("shortcode")
+    ]
+    if not rows:
+        return 0
+
+    try:
+        result = supabase.table(QUEUE_TABLE).upsert(
+            rows, on_conflict="instagram_shortcode", ignore_duplicates=True
+        ).execute()
+        return len(result.data or [])
+    except Exception as e:
+        print(f"Error enqueueing posts: {e}")
+        return 0
+
+
+def claim_batch(worker_id, batch_size=5, lease_seconds=600, max_attempts=3):
+    """
+    Leases up to batch_size queued posts (highest score first) for this worker.
+    Uses the claim_post_queue() SQL function, which locks rows with
+    FOR UPDATE SKIP LOCKED so concurrent workers never receive the same row.
+    """
+    if not supabase:
+        print("Supabase client not initialized.")
+        return []
+
+    try:
+        result = supabase.rpc("claim_post_queue", {
+            "p_worker": worker_id,
+            "p_batch_size": batch_size,
+            "p_lease_seconds": lease_seconds,
+            "p_max_attempts": max_attempts,
+        }).execute()
+        return result.data or []
+    except Exception as e:
+        print(f"Error claiming queue batch: {e}")
+        return []
+
+
+def renew_lease(worker_id, item_ids, lease_seconds=600):
+    """Extends the lease on items this worker still holds. Returns the number renewed."""
+    if not supabase or not item_ids:
+        return 0
+
+    try:
+        result = supabase.rpc("renew_post_queue_lease", {
+            "p_worker": worker_id,
+            "p_ids": list(item_ids),
+            "p_lease_seconds": lease_seconds,
+        }).execute()
+        return result.data or 0
+    except Exception as e:
+        print(f"Error renewing queue lease: {e}")
+        return 0
+
+
+def complete_item(worker_id, item_id):
+    """
+    Marks a leased item as done. Returns False if the lease was lost
+    (expired and claimed by another worker); save_post() is an upsert, so the
+    other worker re-saving the same shortcode is harmless.
+    """
+    if not supabase:
+        return False
+
+    try:
+        result = (
+            supabase.table(QUEUE_TABLE)
+            .update({"status": "done", "lease_owner": None, "lease_expires_at": None, "last_error": None})
+            .eq("id", item_id)
+            .eq("lease_owner", worker_id)
+            .eq("status", "leased")
+            .execute()
+        )
+        return bool(result.data)
+    except Exception as e:
+        print(f"Error completing queue item {item_id}: {e}")
+        return False
+
+
+def failure_fields(item, error, max_attempts=3):
+    """Column updates for a failed attempt: back to the queue, or failed after max_attempts."""
+    return {
+        "status": "failed" if item.get("attempts", 0) >= max_attempts else "queued",
+        "lease_owner": None,
+        "lease_expires_at": None,
+        "last_error": str(error)[:1000],
+    }
+
+
+def release_fields(item):
+    """Column updates that hand a leased item back without using up an attempt."""
+    return {
+        "status": "queued",
+        "lease_owner": None,
+        "lease_expires_at": None,
+        "attempts": max(item.get("attempts", 1) - 1, 0),
+    }
+
+
+def fail_item(worker_id, item, error, max_attempts=3):
+    """Returns a leased item to the queue, or marks it failed after max_attempts."""
+    if not supabase:
+        return False
+
+    try:
+        (
+            supabase.table(QUEUE_TABLE)
+            .update(failure_fields(item, error, max_attempts))
+            .eq("id", item["id"])
+            .eq("lease_owner", worker_id)
+            .execute()
+        )
+        return True
+    except Exception as e:
+        print(f"Error returning queue item {item.get('id')}: {e}")
+        return False
+
+
+def release_item(worker_id, item):
+    """Hands an unprocessed leased item back to the queue without using up an attempt."""
+    if not supabase:
+        return False
+
+    try:
+        (
+            supabase.table(QUEUE_TABLE)
+            .update(release_fields(item))
+            .eq("id", item["id"])
+            .eq("lease_owner", worker_id)
+            .execute()
+        )
+        return True
+    except Exception as e:
+        print(f"Error releasing queue item {item.get('id')}: {e}")
+        return False
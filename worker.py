@@ -0,0 +1,90 @@
+import os
+import socket
+import time
+import argparse
+
+from analyzer import analyze_post, attach_source_metadata, RATE_LIMIT_SECONDS
+from database import save_post
+from scoring import estimate_tokens
+from work_queue import claim_batch, renew_lease, complete_item, fail_item, release_item
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Toronto Info Scraper - analysis worker")
+    parser.add_argument("--worker-id", type=str, default=f"{socket.gethostname()}-{os.getpid()}", help="Unique worker name used as lease owner (default: hostname-pid)")
+    parser.add_argument("--batch-size", type=int, default=5, help="Posts to claim per lease (default: 5)")
+    parser.add_argument("--lease-seconds", type=int, default=600, help="Lease duration before another worker may reclaim the batch (default: 600)")
+    parser.add_argument("--max-attempts", type=int, default=3, help="Claims per post before it is marked failed (default: 3)")
+    parser.add_argument("--token-budget", type=int, default=0, help="Maximum Gemini tokens to spend before exiting (default: 0 = unlimited)")
+    parser.add_argument("--poll-interval", type=int, default=0, help="Seconds to wait when the queue is empty; 0 exits instead (default: 0)")
+    args = parser.parse_args()
+
+    print(f"=== Starting Analysis Worker {args.worker_id} ===")
+    print(f"Settings: BatchSize={args.batch_size}, Lease={args.lease_seconds}s, MaxAttempts={args.max_attempts}, TokenBudget={args.token_budget or 'unlimited'}")
+
+    tokens_used = 0
+    processed = 0
+    saved_count = 0
+    failed = 0
+    budget_exhausted = False
+
+    while not budget_exhausted:
+        batch = claim_batch(args.worker_id, args.batch_size, args.lease_seconds, args.max_attempts)
+        if not batch:
+            if args.poll_interval <= 0:
+                print("\nQueue is empty.")
+                break
+            time.sleep(args.poll_interval)
+            continue
+
+        print(f"\nClaimed {len(batch)} posts.")
+        held_ids = [item["id"] for item in batch]
+
+        for item in batch:
+            post = item["payload"]
+            estimated = estimate_tokens(post)
+            if args.token_budget and tokens_used + estimated > args.token_budget:
+                print(f"\nToken budget exhausted ({tokens_used}/{args.token_budget}). Releasing {len(held_ids)} posts.")
+                for rest in batch[batch.index(item):]:
+                    release_item(args.worker_id, rest)
+                budget_exhausted = True
+                break
+
+            print(f"\n--- Analyzing {post.get('shortcode')} (score {item.get('score', 0):.1f}, attempt {item.get('attempts')}) ---")
+            try:
+                analysis_result = analyze_post(post)
+                tokens_used += analysis_result.pop("token_count", estimated)
+                processed += 1
+
+                category = analysis_result.get("category", "Error")
+                print(f"Category: {category}")
+
+                if category == "Error":
+                    failed += 1
+                    fail_item(args.worker_id, item, analysis_result.get("error"), args.max_attempts)
+                elif save_post(attach_source_metadata(analysis_result, post)):
+                    saved_count += 1
+                    if not complete_item(args.worker_id, item["id"]):
+                        print("Lease was lost before completion; another worker owns this post now.")
+                else:
+                    failed += 1
+                    fail_item(args.worker_id, item, "save_post failed", args.max_attempts)
+            except Exception as e:
+                print(f"Error processing post: {e}")
+                failed += 1
+                fail_item(args.worker_id, item, e, args.max_attempts)
+
+            held_ids.remove(item["id"])
+            time.sleep(RATE_LIMIT_SECONDS)
+            # Keep the remaining posts of this batch from expiring while we work through it
+            renew_lease(args.worker_id, held_ids, args.lease_seconds)
+
+    print("\n=== Worker Summary ===")
+    print(f"Analyzed: {processed}")
+    print(f"Saved to DB: {saved_count}")
+    print(f"Failed: {failed}")
+    print(f"Tokens Used: {tokens_used}" + (f" / {args.token_budget}" if args.token_budget else ""))
+    print("=== Done ===")
+
+if __name__ == "__main__":
+    main()